@@ -1,21 +1,23 @@
 import logging
 import sys
-import instaloader
-import os
-from pathlib import Path
 import random
 import asyncio
-import tempfile
-import shutil
-from video_processor import process_video_file  # Import from new module
+from collections.abc import Sequence
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import BufferedInputFile, Message
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import BufferedInputFile, InputMediaVideo, Message
 from aiogram.enums import ParseMode
 
 from settings import settings
+from downloader import Video, detect_platform, download_video
+import profiling
+from profiling import timed, trace_request
+from scheduler import RateLimitedError, scheduler
 from tiktok.api import TikTokAPI
-from urllib.parse import urlparse
+from tiktok.data import ResolvedLink
+from utils import Deadline, TemporarilyUnavailableError, UnavailableError
+from instagram import login_to_instagram
 
 # Butler-style processing messages
 INSTAGRAM_BUTLER_MESSAGES = [
@@ -48,52 +50,19 @@ logger.info("Initializing bot dispatcher...")
 # Initialize dispatcher only (bot is initialized in main.py)
 dp = Dispatcher()
 
-# Initialize Instagram loader with login if credentials are provided
-insta_loader = instaloader.Instaloader(
-    download_videos=True,
-    download_video_thumbnails=False,
-    download_geotags=False,
-    download_comments=False,
-    save_metadata=False,
-    compress_json=False,
-    max_connection_attempts=5,
-    request_timeout=30,
-    user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-    quiet=True
-)
 
-# Try to login to Instagram if credentials are provided
-if hasattr(settings, 'instagram_username') and hasattr(settings, 'instagram_password'):
-    async def login_to_instagram(force_new=False):
-        try:
-            logger.info("Logging into Instagram...")
-            session_file = Path("session-" + settings.instagram_username)
-
-            if not force_new and session_file.exists():
-                logger.info("Loading existing session...")
-                try:
-                    insta_loader.load_session_from_file(
-                        settings.instagram_username, session_file)
-                    logger.info("Successfully loaded existing session")
-                except Exception as e:
-                    logger.warning(f"Failed to load existing session: {e}")
-                    return await login_to_instagram(force_new=True)
-            else:
-                if session_file.exists():
-                    session_file.unlink()  # Remove old session file
-                logger.info("Creating new session...")
-                insta_loader.login(settings.instagram_username,
-                                   settings.instagram_password)
-                insta_loader.save_session_to_file(session_file)
-                logger.info("Successfully created new session")
-
-            return True
-        except Exception as e:
-            logger.error(f"Failed to login to Instagram: {e}")
-            if session_file.exists():
-                session_file.unlink()  # Remove failed session file
-            return False
+@dp.startup()
+async def start_profiling() -> None:
+    profiling.start()
+
+
+@dp.shutdown()
+async def stop_profiling() -> None:
+    profiling.stop()
+
 
+# Try to login to Instagram if credentials are provided
+if settings.instagram_username and settings.instagram_password:
     # Create startup handler to initialize Instagram login
     @dp.startup()
     async def on_startup():
@@ -102,234 +71,189 @@ else:
     logger.warning(
         "No Instagram credentials provided. Some features might be limited.")
 
-tiktokFilters = [
-    F.text.contains("tiktok.com"),
-    (not settings.allowed_ids)
-    | F.chat.id.in_(settings.allowed_ids)
-    | F.from_user.id.in_(settings.allowed_ids),
-]
-
+MEDIA_GROUP_LIMIT = 10  # Telegram accepts 2-10 items per media group
 
-@dp.message(*tiktokFilters)
-@dp.channel_post(*tiktokFilters)
-async def handle_tiktok_request(message: Message, bot: Bot) -> None:
-    entries = [
-        message.text[e.offset: e.offset + e.length]
-        for e in message.entities or []
-        if message.text is not None
-    ]
-
-    urls = [
-        u if u.startswith("http") else f"https://{u}"
-        for u in filter(lambda e: "tiktok.com" in e, entries)
-    ]
-
-    logger.info(f"Processing Tiktok link: {urls[0]}")
-
-    async for tiktok in TikTokAPI.download_tiktoks(urls):
-        if not tiktok.video:
-            logger.warning(f"No video data found for TikTok URL: {urls[0]}")
-            continue
-
-        processing_msg = await message.answer(random.choice(TIKTOK_BUTLER_MESSAGES), reply_to_message_id=message.message_id)
-
-        try:
-            # Process video to maintain aspect ratio
-            processed_video, width, height = await process_video_file(tiktok.video, "tiktok_video.mp4")
-            video = BufferedInputFile(processed_video, filename="video.mp4")
-            caption = tiktok.caption if settings.with_captions else None
-
-            logger.info(
-                f"Sending TikTok video to chat ID: {message.chat.id} with dimensions {width}x{height}")
-
-            if settings.reply_to_message:
-                await message.reply_video(
-                    video=video,
-                    caption=caption,
-                    parse_mode=ParseMode.HTML,
-                    width=width,
-                    height=height,
-                    supports_streaming=True
-                )
-            else:
-                await bot.send_video(
-                    chat_id=message.chat.id,
-                    video=video,
-                    caption=caption,
-                    parse_mode=ParseMode.HTML,
-                    width=width,
-                    height=height,
-                    supports_streaming=True
-                )
-
-        except Exception as e:
-            logger.error(f"Failed to process TikTok video: {e}")
-            await message.reply("🎭 My sincerest apologies, but I encountered difficulties processing this TikTok video.")
-        finally:
-            await processing_msg.delete()
-
-
-# IG
-
-igFilters = [
-    F.text.contains("instagram.com"),
+videoFilters = [
+    F.text.contains("tiktok.com") | F.text.contains("instagram.com"),
     (not settings.allowed_ids)
     | F.chat.id.in_(settings.allowed_ids)
     | F.from_user.id.in_(settings.allowed_ids),
 ]
 
 
-@dp.message(*igFilters)
-@dp.channel_post(*igFilters)
-async def handle_instagram_request(message: Message, bot: Bot) -> None:
+@dp.message(*videoFilters)
+@dp.channel_post(*videoFilters)
+async def handle_video_request(message: Message, bot: Bot) -> None:
     entries = [
         message.text[e.offset: e.offset + e.length]
         for e in message.entities or []
         if message.text is not None
     ]
 
-    urls = [
+    urls = list(dict.fromkeys(
         u if u.startswith("http") else f"https://{u}"
-        for u in filter(lambda e: "instagram.com" in e, entries)
-    ]
-
-    processing_msg = await message.answer(random.choice(INSTAGRAM_BUTLER_MESSAGES), reply_to_message_id=message.message_id)
-    start_time = asyncio.get_event_loop().time()
-    TIMEOUT_SECONDS = 120  # 2 minutes timeout
-
-    for url in urls:
+        for u in filter(detect_platform, entries)
+    ))
+    if not urls:
+        return
+
+    chat_id = message.chat.id
+    user_id = message.from_user.id if message.from_user else chat_id
+    admitted, retry_after = scheduler.admit(chat_id, user_id, len(urls))
+    rejected = [(url, RateLimitedError(retry_after)) for url in urls[admitted:]]
+    urls = urls[:admitted]
+    if not urls:
+        await message.reply(format_failures(rejected, len(rejected)))
+        return
+
+    logger.info(f"Processing {len(urls)} link(s) from chat ID {chat_id}: {urls}")
+    butler_messages = (
+        TIKTOK_BUTLER_MESSAGES
+        if all(detect_platform(url) == "tiktok" for url in urls)
+        else INSTAGRAM_BUTLER_MESSAGES
+    )
+    processing_msg = await message.answer(random.choice(butler_messages), reply_to_message_id=message.message_id)
+
+    try:
+        async with trace_request("video request", chat_id=chat_id, urls=urls):
+            with timed("download"):
+                videos, failures = await download_videos(urls, chat_id, user_id)
+            with timed("delivery"):
+                await deliver_videos(message, bot, videos)
+        failures += rejected
+        if failures:
+            await message.reply(format_failures(failures, len(urls) + len(rejected)))
+    finally:
+        await processing_msg.delete()
+
+
+async def download_videos(
+    urls: list[str], chat_id: int, user_id: int
+) -> tuple[list[Video], list[tuple[str, BaseException]]]:
+    """
+    Fetch and process every link of a message concurrently, at most
+    settings.message_concurrency at a time and within the chat's fair share
+    of scheduler slots and the user's quota. Waiting for a slot is bounded by
+    settings.queue_timeout; each link's request deadline starts once it holds
+    one. Results keep the message order.
+    """
+    videos: list[Video] = []
+    failures: list[tuple[str, BaseException]] = []
+
+    tiktok_urls = [url for url in urls if detect_platform(url) == "tiktok"]
+    links: dict[str, ResolvedLink | None] = {}
+    if tiktok_urls:
         try:
-            logger.info(f"Starting to process Instagram URL: {url}")
-            # Parse the URL to get the path
-            parsed_url = urlparse(url)
-            path_parts = parsed_url.path.strip("/").split("/")
-
-            # Check if the URL path is valid and contains 'reel' followed by a shortcode
-            if len(path_parts) >= 2 and path_parts[0] == "reel":
-                shortcode = path_parts[1]
-                logger.info(f"Extracted shortcode: {shortcode}")
+            links = await TikTokAPI.resolve_links(tiktok_urls, Deadline(settings.request_timeout))
+        except TimeoutError as e:
+            logger.error(f"Timed out resolving TikTok links: {e}")
+            failures += [(url, e) for url in tiktok_urls]
+    # Drop TikTok links that resolve to a video already in this message
+    urls = [url for url in urls if url in links or url not in tiktok_urls]
+
+    semaphore = asyncio.Semaphore(settings.message_concurrency)
+
+    async def download(url: str) -> Video:
+        async with semaphore, scheduler.slot(chat_id, user_id, settings.queue_timeout or None):
+            # Links that failed to resolve above are not resolved again
+            return await download_video(
+                url, Deadline(settings.request_timeout), links.get(url), resolve=url not in links)
+
+    results = await asyncio.gather(*(download(url) for url in urls), return_exceptions=True)
+
+    for url, result in zip(urls, results):
+        if isinstance(result, BaseException):
+            if isinstance(result, UnavailableError):
+                logger.warning(f"Link {url} is unavailable: {result.reason}")
             else:
-                logger.warning(f"Invalid Instagram reel URL: {url}")
-                await message.reply("Invalid Instagram reel URL. Please send a valid reel link.")
-                continue
-
-            # Load the post using the shortcode with improved retry logic
-            max_retries = 5
-            retry_count = 0
-            last_error = None
-            post = None
-
-            while retry_count < max_retries and post is None:
-                try:
-                    if asyncio.get_event_loop().time() - start_time > TIMEOUT_SECONDS:
-                        raise TimeoutError("Processing took too long")
-
-                    if retry_count > 0:
-                        logger.info(
-                            f"Attempting retry {retry_count}/{max_retries}")
-                        await asyncio.sleep(2 ** retry_count)
-
-                    logger.info(
-                        f"Fetching post data for shortcode: {shortcode}")
-                    post = instaloader.Post.from_shortcode(
-                        insta_loader.context, shortcode)
-                    logger.info("Successfully fetched post data")
-
-                except instaloader.exceptions.ConnectionException as e:
-                    retry_count += 1
-                    last_error = e
-                    logger.warning(
-                        f"Retry {retry_count}/{max_retries} after connection error: {e}")
-                    if retry_count == max_retries:
-                        raise
-                except instaloader.exceptions.BadResponseException as e:
-                    if "login_required" in str(e):
-                        logger.info(
-                            "Session expired, attempting to refresh...")
-                        if await login_to_instagram(force_new=True):
-                            retry_count += 1
-                            continue
-                    retry_count += 1
-                    last_error = e
-                    logger.warning(
-                        f"Retry {retry_count}/{max_retries} after bad response: {e}")
-                    if retry_count == max_retries:
-                        raise
-
-            if post is None:
-                raise Exception("Failed to fetch post data after all retries")
-
-            # Create a temporary directory that will be automatically cleaned up
-            with tempfile.TemporaryDirectory() as temp_dir:
-                if asyncio.get_event_loop().time() - start_time > TIMEOUT_SECONDS:
-                    raise TimeoutError("Processing took too long")
-
+                logger.error(f"Failed to process {url}: {result!r}")
+            failures.append((url, result))
+        else:
+            videos.append(result)
+    return videos, failures
+
+
+async def deliver_videos(message: Message, bot: Bot, videos: list[Video]) -> None:
+    """
+    Send videos as media groups of up to MEDIA_GROUP_LIMIT items, falling back
+    to individual sends for single leftovers or when a group is rejected.
+    """
+    for i in range(0, len(videos), MEDIA_GROUP_LIMIT):
+        chunk = videos[i: i + MEDIA_GROUP_LIMIT]
+        if len(chunk) > 1:
+            try:
                 logger.info(
-                    f"Downloading post to temporary directory: {temp_dir}")
-                insta_loader.dirname_pattern = temp_dir
-                insta_loader.download_post(post, target=shortcode)
-                logger.info("Post download completed")
-
-                # Find the video file in the temporary directory
-                video_path = next(
-                    (os.path.join(root, f)
-                     for root, _, files in os.walk(temp_dir)
-                     for f in files if f.endswith('.mp4')),
-                    None
-                )
-
-                if not video_path:
-                    logger.warning(f"No video file found for post {shortcode}")
-                    await processing_msg.delete()
-                    await message.reply("Sorry, couldn't find a video in this Instagram post.")
-                    continue
-
-                logger.info(f"Found video file at: {video_path}")
-                with open(video_path, 'rb') as video_file:
-                    video_data = video_file.read()
-
-                logger.info("Processing video file...")
-                processed_video, width, height = await process_video_file(video_data, "instagram_video.mp4")
-                video = BufferedInputFile(
-                    processed_video, filename="insta_video.mp4")
-                caption = post.caption if settings.with_captions else None
-
-                logger.info(
-                    f"Sending Instagram video to chat ID: {message.chat.id} with dimensions {width}x{height}")
-
-                try:
-                    if settings.reply_to_message:
-                        await message.reply_video(
-                            video=video,
-                            caption=caption,
-                            parse_mode=ParseMode.HTML,
-                            width=width,
-                            height=height,
-                            supports_streaming=True
-                        )
-                    else:
-                        await bot.send_video(
-                            chat_id=message.chat.id,
-                            video=video,
-                            caption=caption,
+                    f"Sending media group of {len(chunk)} videos to chat ID: {message.chat.id}")
+                await bot.send_media_group(
+                    chat_id=message.chat.id,
+                    media=[
+                        InputMediaVideo(
+                            media=BufferedInputFile(video.data, filename=f"{video.platform}_video.mp4"),
+                            caption=video.caption,
                             parse_mode=ParseMode.HTML,
-                            width=width,
-                            height=height,
+                            width=video.width,
+                            height=video.height,
                             supports_streaming=True
                         )
-                    logger.info("Successfully sent video to user")
-                except Exception as e:
-                    logger.error(f"Failed to send video: {e}")
-                    raise
-
-                await processing_msg.delete()
-
-        except TimeoutError:
-            logger.error(
-                f"Processing timed out after {TIMEOUT_SECONDS} seconds")
-            await processing_msg.delete()
-            await message.reply("Sorry, the request timed out. Please try again later.")
-        except Exception as e:
-            logger.exception(f"Error downloading Instagram video: {e}")
-            await processing_msg.delete()
-            await message.reply(f"Sorry, there was an error processing your Instagram link: {str(e)}")
+                        for video in chunk
+                    ],
+                    reply_to_message_id=message.message_id if settings.reply_to_message else None
+                )
+                continue
+            except TelegramAPIError as e:
+                logger.warning(f"Failed to send media group, sending videos one by one: {e}")
+
+        for video in chunk:
+            try:
+                await send_video(message, bot, video)
+            except Exception as e:
+                logger.error(f"Failed to send video {video.url}: {e}")
+                await message.reply("🎭 My sincerest apologies, but I encountered difficulties sending this video.")
+
+
+async def send_video(message: Message, bot: Bot, video: Video) -> None:
+    logger.info(
+        f"Sending {video.platform} video to chat ID: {message.chat.id} with dimensions {video.width}x{video.height}")
+    input_file = BufferedInputFile(video.data, filename=f"{video.platform}_video.mp4")
+
+    if settings.reply_to_message:
+        await message.reply_video(
+            video=input_file,
+            caption=video.caption,
+            parse_mode=ParseMode.HTML,
+            width=video.width,
+            height=video.height,
+            supports_streaming=True
+        )
+    else:
+        await bot.send_video(
+            chat_id=message.chat.id,
+            video=input_file,
+            caption=video.caption,
+            parse_mode=ParseMode.HTML,
+            width=video.width,
+            height=video.height,
+            supports_streaming=True
+        )
+
+
+def format_failures(failures: Sequence[tuple[str, BaseException]], total: int) -> str:
+    lines = []
+    for url, error in failures:
+        if isinstance(error, UnavailableError):
+            reason = error.reason
+        elif isinstance(error, TemporarilyUnavailableError):
+            reason = str(error)
+        elif isinstance(error, RateLimitedError):
+            reason = f"too many requests, please try again in {error.retry_after:.0f} seconds"
+        elif isinstance(error, TimeoutError):
+            reason = "the request timed out"
+        else:
+            reason = "an error occurred while processing it"
+        lines.append(f"• {url}: {reason}")
+
+    if total == 1:
+        header = "🎭 My sincerest apologies, but I could not fetch this video:"
+    else:
+        header = f"🎭 My sincerest apologies, but I could not fetch {len(failures)} of your {total} videos:"
+    return "\n".join([header, *lines])
@@ -0,0 +1,121 @@
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Generic, TypeVar
+
+import httpx
+
+from settings import settings
+from tiktok.data import ResolvedLink
+from utils import TemporarilyUnavailableError, UnavailableError
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    In-memory LRU cache whose entries also expire after a per-entry TTL.
+    Not thread-safe; meant to be used from the event loop only.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K) -> V | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V, ttl: float) -> None:
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K) -> V | None:
+        entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+
+@dataclass
+class Failure:
+    reason: str
+    transient: bool
+
+
+class NegativeCache:
+    """
+    Remembers links that recently failed so repeat requests fail fast.
+    Terminal failures (deleted, private, no video) are kept for `ttl` seconds,
+    transient ones (network errors, upstream 5xx/429) only for `transient_ttl`
+    so an outage does not blacklist working links for long.
+    """
+
+    def __init__(self, ttl: float, transient_ttl: float, maxsize: int) -> None:
+        self.ttl = ttl
+        self.transient_ttl = transient_ttl
+        self._cache: TTLCache[str, Failure] = TTLCache(maxsize)
+
+    def get(self, key: str) -> Failure | None:
+        failure = self._cache.get(key)
+        if failure:
+            logger.info(f"Negative cache hit for {key}: {failure.reason}")
+        return failure
+
+    def check(self, key: str) -> None:
+        """
+        Fail fast if `key` failed recently: terminal failures raise UnavailableError
+        with their reason, transient ones TemporarilyUnavailableError.
+        """
+        failure = self.get(key)
+        if failure is None:
+            return
+        if failure.transient:
+            raise TemporarilyUnavailableError
+        raise UnavailableError(failure.reason)
+
+    def record(self, key: str, reason: str, transient: bool = False) -> None:
+        logger.info(
+            f"Caching {'transient' if transient else 'terminal'} failure for {key}: {reason}"
+        )
+        ttl = self.transient_ttl if transient else self.ttl
+        self._cache.set(key, Failure(reason=reason, transient=transient), ttl)
+
+    def record_error(self, key: str, error: BaseException) -> None:
+        """
+        Cache an error that may not recur as a transient failure. Only its type or
+        HTTP status is kept, since messages can hold signed URLs and are shown to users.
+        """
+        reason = type(error).__name__
+        if isinstance(error, httpx.HTTPStatusError):
+            reason = f"HTTP {error.response.status_code}"
+        self.record(key, reason, transient=True)
+
+    def forget(self, key: str) -> None:
+        self._cache.pop(key)
+
+
+negative_cache = NegativeCache(
+    ttl=settings.negative_cache_ttl,
+    transient_ttl=settings.negative_cache_transient_ttl,
+    maxsize=settings.negative_cache_size,
+)
+
+# Short TikTok links (vm./vt.tiktok.com) -> canonical video id and URL
+short_link_cache: TTLCache[str, ResolvedLink] = TTLCache(settings.short_link_cache_size)
@@ -1,73 +1,175 @@
+import argparse
+import asyncio
+import hashlib
+import json
 import logging
 import sys
-import instaloader
-import os
-import asyncio
-from urllib.parse import urlparse
+import time
+from dataclasses import asdict, dataclass
 from pathlib import Path
+from typing import TextIO
+
+from humanize import naturalsize
+
+from downloader import detect_platform, download_video
+from settings import settings
+from utils import Deadline
 
-# Testing the downloader code directly
+# Bulk downloader: fetches TikTok and Instagram links through the same
+# client and processing pipeline as the bot and archives the results.
+#
+#   python app/core.py -i links.txt -o downloads -j 8
+#   cat links.txt | python app/core.py
 
-# Set up logging
 logging.basicConfig(
-    stream=sys.stdout,
+    stream=sys.stderr,
     level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
 
 logger = logging.getLogger(__name__)
-logger.info("Instagram Downloader started...")
-
-# Initialize Instaloader
-insta_loader = instaloader.Instaloader()
-
-
-async def download_instagram_reel(url):
-    try:
-        parsed_url = urlparse(url)
-        path_parts = parsed_url.path.strip("/").split("/")
-
-        if len(path_parts) >= 2 and path_parts[0] == "reel":
-            shortcode = path_parts[1].strip()  # Clean up any whitespace
-        else:
-            logger.error(f"Invalid Instagram reel URL: {url}")
-            return
-
-        # Construct the target directory path using pathlib
-        target_dir = Path("downloads") / f"instagram_{shortcode}"
-        logger.info(f"Creating directory: {target_dir}")
-        # Create the directory if it doesn't exist
-        target_dir.mkdir(parents=True, exist_ok=True)
-
-        # Load the post using the shortcode
-        post = instaloader.Post.from_shortcode(insta_loader.context, shortcode)
-
-        # Download the post
-        insta_loader.download_post(post, target_dir)
-
-        # Find the video file in the download directory
-        video_file = next(target_dir.glob("*.mp4"), None)
-
-        if video_file:
-            logger.info(f"Downloaded video to: {video_file}")
-
-            # Wait for 2 seconds before deleting the downloaded files
-            await asyncio.sleep(2)
 
-            # Cleanup: Remove downloaded files after waiting
-            for file in target_dir.iterdir():
-                file.unlink()  # Remove the file
-            target_dir.rmdir()  # Remove the directory after cleaning up files
-            logger.info(f"Deleted downloaded files from: {target_dir}")
-        else:
-            logger.error("No video file found.")
 
-    except Exception as e:
-        logger.error(f"Error downloading Instagram video: {e}")
+@dataclass
+class ManifestEntry:
+    url: str
+    platform: str
+    status: str
+    path: str | None = None
+    width: int = 0
+    height: int = 0
+    size: int = 0
+    elapsed: float = 0.0
+    error: str | None = None
+
+
+def read_urls(source: TextIO) -> list[str]:
+    """Read one URL per line, skipping blanks, comments and duplicates"""
+    urls: list[str] = []
+    seen: set[str] = set()
+    for line in source:
+        url = line.strip()
+        if not url or url.startswith("#"):
+            continue
+        if not url.startswith("http"):
+            url = f"https://{url}"
+        if url not in seen:
+            seen.add(url)
+            urls.append(url)
+    return urls
+
+
+def write_video(output_dir: Path, platform: str, data: bytes) -> Path:
+    """
+    Write a processed video named by its content hash, so reruns into the same
+    directory never overwrite a file that an earlier manifest line points to
+    with different bytes.
+    """
+    path = output_dir / f"{platform}_{hashlib.sha256(data).hexdigest()[:16]}.mp4"
+    if not path.exists():
+        path.write_bytes(data)
+    return path
+
+
+async def download_one(url: str, output_dir: Path, semaphore: asyncio.Semaphore) -> ManifestEntry:
+    platform = detect_platform(url)
+    if platform is None:
+        return ManifestEntry(url=url, platform="unknown", status="skipped", error="unsupported URL")
+
+    async with semaphore:
+        start_time = time.monotonic()
+        entry = ManifestEntry(url=url, platform=platform, status="failed")
+        deadline = Deadline(settings.request_timeout)
+        try:
+            video = await download_video(url, deadline)
+            path = await asyncio.to_thread(write_video, output_dir, platform, video.data)
+
+            entry.status = "ok"
+            entry.path = str(path)
+            entry.width = video.width
+            entry.height = video.height
+            entry.size = len(video.data)
+        except Exception as e:
+            logger.error(f"Failed to download {url}: {e}")
+            entry.error = str(e)
+        finally:
+            entry.elapsed = round(time.monotonic() - start_time, 3)
+        return entry
+
+
+async def run(urls: list[str], output_dir: Path, concurrency: int) -> int:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / "manifest.jsonl"
+    semaphore = asyncio.Semaphore(concurrency)
+
+    logger.info(f"Downloading {len(urls)} links to {output_dir} with concurrency {concurrency}")
+    start_time = time.monotonic()
+    succeeded = failed = total_bytes = 0
+
+    tasks = [download_one(url, output_dir, semaphore) for url in urls]
+    with manifest_path.open("a", encoding="utf-8") as manifest:
+        for task in asyncio.as_completed(tasks):
+            entry = await task
+            manifest.write(json.dumps(asdict(entry)) + "\n")
+            manifest.flush()
+            if entry.status == "ok":
+                succeeded += 1
+                total_bytes += entry.size
+            else:
+                failed += 1
+            logger.info(f"[{succeeded + failed}/{len(urls)}] {entry.status}: {entry.url}")
+
+    elapsed = time.monotonic() - start_time
+    rate = len(urls) / elapsed if elapsed else 0.0
+    byte_rate = total_bytes / elapsed if elapsed else 0.0
+    print(
+        f"{succeeded} ok, {failed} failed in {elapsed:.2f}s "
+        f"({rate:.2f} links/s, {naturalsize(total_bytes)} at {naturalsize(byte_rate)}/s)\n"
+        f"Manifest: {manifest_path}"
+    )
+    return 0 if failed == 0 else 1
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Bulk-download TikTok and Instagram videos through the TeleTok pipeline."
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=argparse.FileType("r", encoding="utf-8"),
+        default=sys.stdin,
+        help="file with one URL per line (default: stdin)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=Path,
+        default=Path("downloads"),
+        help="directory for processed videos and manifest.jsonl (default: downloads)",
+    )
+    parser.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=4,
+        help="maximum links processed at once (default: 4)",
+    )
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    return args
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    with args.input:
+        urls = read_urls(args.input)
+    if not urls:
+        logger.warning("No URLs to download")
+        return 0
+    return asyncio.run(run(urls, args.output_dir, args.concurrency))
 
 
-# Test the downloader directly
 if __name__ == "__main__":
-    # Replace <shortcode> with a valid shortcode
-    test_url = "https://www.instagram.com/reel/DAqS5YtO10X/"
-    asyncio.run(download_instagram_reel(test_url))
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import logging
+from dataclasses import dataclass
+
+from instagram import download_reel, extract_shortcode
+from settings import settings
+from tiktok.api import TikTokAPI
+from tiktok.data import ResolvedLink
+from utils import Deadline, UnavailableError
+from video_processor import process_video_file
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Video:
+    url: str
+    platform: str
+    data: bytes
+    width: int
+    height: int
+    caption: str | None
+
+
+def detect_platform(url: str) -> str | None:
+    if "tiktok.com" in url:
+        return "tiktok"
+    if "instagram.com" in url:
+        return "instagram"
+    return None
+
+
+async def download_video(
+    url: str,
+    deadline: Deadline | None = None,
+    link: ResolvedLink | None = None,
+    resolve: bool = True,
+) -> Video:
+    """
+    Fetch a TikTok or Instagram link and process it for Telegram.
+    Raises UnavailableError if the link has no video, TemporarilyUnavailableError
+    if it failed transiently moments ago, and lets other errors propagate.
+    `link` and `resolve` are passed on to TikTokAPI.download_tiktok.
+    """
+    platform = detect_platform(url)
+    if platform == "tiktok":
+        tiktok = await TikTokAPI.download_tiktok(url, deadline, link, resolve)
+        video_data, caption = tiktok.video, tiktok.caption
+    elif platform == "instagram":
+        shortcode = extract_shortcode(url)
+        if not shortcode:
+            raise UnavailableError("not an Instagram reel link")
+        reel = await download_reel(url, shortcode, deadline)
+        video_data, caption = reel.video, reel.caption
+    else:
+        raise UnavailableError("unsupported link")
+
+    if not video_data:
+        raise UnavailableError("no video found")
+
+    processed_video, width, height = await process_video_file(
+        video_data, f"{platform}_video.mp4", deadline
+    )
+    return Video(
+        url=url,
+        platform=platform,
+        data=processed_video,
+        width=width,
+        height=height,
+        caption=caption if settings.with_captions else None,
+    )
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import urlparse
+
+import httpx
+import instaloader
+
+from cache import negative_cache
+from profiling import timed
+from settings import settings
+from utils import Deadline, UnavailableError
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = 5
+
+# Shared Instagram loader, logged in on bot startup if credentials are provided
+insta_loader = instaloader.Instaloader(
+    download_videos=True,
+    download_video_thumbnails=False,
+    download_geotags=False,
+    download_comments=False,
+    save_metadata=False,
+    compress_json=False,
+    max_connection_attempts=5,
+    request_timeout=30,
+    user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
+    quiet=True,
+)
+
+
+@dataclass
+class Reel:
+    url: str = ""
+    shortcode: str = ""
+    description: str = ""
+    video: bytes | None = None
+
+    @property
+    def caption(self) -> str:
+        return self.description
+
+
+def extract_shortcode(url: str) -> str | None:
+    """Return the reel shortcode from an Instagram URL, or None if it is not a reel link"""
+    path_parts = urlparse(url).path.strip("/").split("/")
+    if len(path_parts) >= 2 and path_parts[0] == "reel":
+        return path_parts[1].strip()
+    return None
+
+
+# Serialises logins so concurrent requests that hit login_required refresh the session once
+_session_lock = asyncio.Lock()
+_session_generation = 0
+
+
+def _login(force_new: bool) -> bool:
+    username = settings.instagram_username or ""
+    session_file = Path("session-" + username)
+    try:
+        logger.info("Logging into Instagram...")
+
+        if not force_new and session_file.exists():
+            logger.info("Loading existing session...")
+            try:
+                insta_loader.load_session_from_file(username, str(session_file))
+                logger.info("Successfully loaded existing session")
+            except Exception as e:
+                logger.warning(f"Failed to load existing session: {e}")
+                return _login(force_new=True)
+        else:
+            if session_file.exists():
+                session_file.unlink()  # Remove old session file
+            logger.info("Creating new session...")
+            insta_loader.login(username, settings.instagram_password or "")
+            insta_loader.save_session_to_file(str(session_file))
+            logger.info("Successfully created new session")
+
+        return True
+    except Exception as e:
+        logger.error(f"Failed to login to Instagram: {e}")
+        if session_file.exists():
+            session_file.unlink()  # Remove failed session file
+        return False
+
+
+async def login_to_instagram(force_new: bool = False) -> bool:
+    """
+    Load the saved session or log in anew, in a worker thread since instaloader
+    blocks. A caller asking for a new session that waited while another one
+    was created reuses it instead of logging in again.
+    """
+    global _session_generation
+    generation = _session_generation
+    async with _session_lock:
+        if force_new and generation != _session_generation:
+            logger.info("Reusing Instagram session refreshed by another request")
+            return True
+        logged_in = await asyncio.to_thread(_login, force_new)
+        if logged_in:
+            _session_generation += 1
+        return logged_in
+
+
+async def fetch_post(shortcode: str, deadline: Deadline | None = None) -> instaloader.Post:
+    """
+    Load post metadata for a shortcode, retrying connection errors with backoff
+    and refreshing the session when Instagram asks for a login.
+    instaloader is blocking, so an expired deadline abandons the worker thread;
+    its own request_timeout bounds how long that thread can linger.
+    """
+    deadline = deadline or Deadline()
+    retry_count = 0
+    while retry_count < MAX_RETRIES:
+        deadline.check("instagram post fetch")
+        try:
+            if retry_count > 0:
+                logger.info(f"Attempting retry {retry_count}/{MAX_RETRIES}")
+                await asyncio.sleep(2**retry_count)
+
+            logger.info(f"Fetching post data for shortcode: {shortcode}")
+            with timed("instagram post request"):
+                post: instaloader.Post = await asyncio.to_thread(
+                    instaloader.Post.from_shortcode, insta_loader.context, shortcode
+                )
+            logger.info("Successfully fetched post data")
+            return post
+
+        except (
+            instaloader.exceptions.QueryReturnedNotFoundException,
+            instaloader.exceptions.ProfileNotExistsException,
+        ) as e:
+            raise UnavailableError("not found") from e
+        except instaloader.exceptions.PrivateProfileNotFollowedException as e:
+            raise UnavailableError("private") from e
+        except instaloader.exceptions.ConnectionException as e:
+            retry_count += 1
+            logger.warning(f"Retry {retry_count}/{MAX_RETRIES} after connection error: {e}")
+            if retry_count == MAX_RETRIES:
+                raise
+        except instaloader.exceptions.BadResponseException as e:
+            if "Fetching Post metadata failed" in str(e):
+                # Deleted and private posts come back with null metadata rather than a 404
+                raise UnavailableError("not found or private") from e
+            if "login_required" in str(e) and settings.instagram_username:
+                logger.info("Session expired, attempting to refresh...")
+                if await login_to_instagram(force_new=True):
+                    retry_count += 1
+                    continue
+            retry_count += 1
+            logger.warning(f"Retry {retry_count}/{MAX_RETRIES} after bad response: {e}")
+            if retry_count == MAX_RETRIES:
+                raise
+
+    raise Exception("Failed to fetch post data after all retries")
+
+
+async def get_video(url: str) -> bytes:
+    async with httpx.AsyncClient(
+        headers={"User-Agent": insta_loader.context.user_agent},
+        timeout=30,
+        follow_redirects=True,
+    ) as client:
+        with timed("instagram video request"):
+            resp = await client.get(url)
+        resp.raise_for_status()
+        video: bytes = resp.content
+        return video
+
+
+async def download_reel(url: str, shortcode: str, deadline: Deadline | None = None) -> Reel:
+    """
+    Fetch a reel and its video bytes. Dead, private and video-less posts raise
+    UnavailableError and are remembered in the negative cache, so repeat requests
+    fail without contacting Instagram; recent transient failures raise
+    TemporarilyUnavailableError.
+    """
+    cache_key = f"instagram:{shortcode}"
+    negative_cache.check(cache_key)
+
+    deadline = deadline or Deadline()
+    try:
+        async with deadline.stage("instagram post fetch", settings.fetch_timeout):
+            post = await fetch_post(shortcode, deadline)
+        if not post.is_video or not post.video_url:
+            logger.warning(f"No video file found for post {shortcode}")
+            raise UnavailableError("no video found")
+
+        logger.info(f"Downloading video for post {shortcode}")
+        async with deadline.stage("instagram video download", settings.download_timeout):
+            video = await get_video(post.video_url)
+    except UnavailableError as e:
+        negative_cache.record(cache_key, e.reason)
+        raise
+    except (
+        instaloader.exceptions.ConnectionException,
+        instaloader.exceptions.BadResponseException,
+        httpx.HTTPError,
+    ) as e:
+        negative_cache.record_error(cache_key, e)
+        raise
+
+    logger.info("Post download completed")
+    return Reel(url=url, shortcode=shortcode, description=post.caption or "", video=video)
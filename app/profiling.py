@@ -0,0 +1,280 @@
+import asyncio
+import json
+import logging
+import signal
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import CodeType, FrameType
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# How far back stack samples and loop lag events are kept for slow-request dumps
+SAMPLE_WINDOW_SECONDS = 300
+
+
+@dataclass
+class RequestTrace:
+    name: str
+    info: dict
+    started_at: float = field(default_factory=time.monotonic)
+    stages: list[tuple[str, float, float]] = field(default_factory=list)
+
+    def record(self, stage: str, start: float, duration: float) -> None:
+        self.stages.append((stage, round(start - self.started_at, 4), round(duration, 4)))
+
+
+_current_trace: ContextVar[RequestTrace | None] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Record how long a block takes in the current request trace, if any.
+    Works around awaits and in worker threads started with asyncio.to_thread.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        trace.record(stage, start, time.monotonic() - start)
+
+
+class StackSampler:
+    """
+    Sampling profiler: a daemon thread snapshots every thread's stack each
+    `interval` seconds while anything holds it. Frame labels are cached per
+    code object and line, and samples are aggregated into one Counter per
+    second, so the cost of a sample is mostly walking the frames. While
+    profiling is toggled on stacks are also aggregated for the whole process
+    and written out when it is toggled off. Recent samples are dropped once
+    the last user releases the sampler.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.profiling = False
+        self.profile: Counter[str] = Counter()
+        self.samples: deque[tuple[int, Counter[str]]] = deque(maxlen=SAMPLE_WINDOW_SECONDS)
+        self._labels: dict[tuple[CodeType, int], str] = {}
+        self._users = 0
+        self._lock = threading.Lock()
+        self._samples_lock = threading.Lock()
+        self._stop: threading.Event | None = None
+
+    def acquire(self) -> None:
+        with self._lock:
+            self._users += 1
+            if self._stop is None:
+                self._stop = threading.Event()
+                threading.Thread(
+                    target=self._run, args=(self._stop,), name="stack-sampler", daemon=True
+                ).start()
+
+    def release(self) -> None:
+        with self._lock:
+            self._users -= 1
+            if self._users <= 0 and self._stop is not None:
+                self._stop.set()
+                self._stop = None
+                with self._samples_lock:
+                    self.samples.clear()
+
+    def _label(self, frame: FrameType) -> str:
+        key = (frame.f_code, frame.f_lineno)
+        label = self._labels.get(key)
+        if label is None:
+            code = frame.f_code
+            label = f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})"
+            self._labels[key] = label
+        return label
+
+    def _collapse(self, frame: FrameType | None, thread_name: str) -> str:
+        """Render a stack root-first in the collapsed format used by flamegraph tools"""
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame))
+            frame = frame.f_back
+        labels.append(thread_name)
+        labels.reverse()
+        return sys.intern(";".join(labels))
+
+    def _run(self, stop: threading.Event) -> None:
+        own_id = threading.get_ident()
+        while not stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = [
+                self._collapse(frame, names.get(thread_id, str(thread_id)))
+                for thread_id, frame in sys._current_frames().items()
+                if thread_id != own_id
+            ]
+            second = int(time.monotonic())
+            with self._samples_lock:
+                if stop.is_set():
+                    break
+                if not self.samples or self.samples[-1][0] != second:
+                    self.samples.append((second, Counter()))
+                self.samples[-1][1].update(stacks)
+                if self.profiling:
+                    self.profile.update(stacks)
+
+    def samples_between(self, start: float, end: float) -> Counter[str]:
+        """Stack counts for the seconds overlapping [start, end]"""
+        counts: Counter[str] = Counter()
+        with self._samples_lock:
+            for second, stacks in self.samples:
+                if int(start) <= second <= int(end):
+                    counts.update(stacks)
+        return counts
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a sleep, i.e. how long it was blocked"""
+
+    def __init__(self, interval: float, threshold: float) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.max_lag = 0.0
+        self.events: deque[tuple[float, float]] = deque(
+            maxlen=max(int(SAMPLE_WINDOW_SECONDS / interval), 1)
+        )
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - start - self.interval
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self.events.append((time.monotonic(), round(lag, 4)))
+                logger.warning(f"Event loop was blocked for {lag * 1000:.0f}ms")
+
+    def events_between(self, start: float, end: float) -> list[float]:
+        return [lag for at, lag in list(self.events) if start <= at <= end]
+
+
+sampler = StackSampler(settings.profiler_interval)
+lag_monitor = LoopLagMonitor(interval=0.1, threshold=settings.loop_lag_threshold)
+
+
+def _write(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def _timestamp() -> str:
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+def toggle_profiler() -> None:
+    """Start whole-process profiling, or stop it and write the collapsed stacks to disk"""
+    if not sampler.profiling:
+        sampler.profile.clear()
+        sampler.profiling = True
+        sampler.acquire()
+        logger.info("Sampling profiler started")
+        return
+
+    sampler.profiling = False
+    sampler.release()
+    path = Path(settings.profiling_dir) / f"profile-{_timestamp()}.txt"
+    _write(path, "".join(f"{stack} {count}\n" for stack, count in sampler.profile.most_common()))
+    logger.info(
+        f"Sampling profiler stopped, {sum(sampler.profile.values())} samples written to {path}"
+    )
+
+
+@asynccontextmanager
+async def trace_request(name: str, **info: object) -> AsyncIterator[RequestTrace]:
+    """
+    Trace one request. If it takes longer than settings.slow_request_threshold,
+    its stage timings, stack samples and loop lag events are dumped to
+    settings.profiling_dir.
+    """
+    trace = RequestTrace(name=name, info=info)
+    token = _current_trace.set(trace)
+    capture = settings.slow_request_threshold > 0
+    if capture:
+        sampler.acquire()
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        ended_at = time.monotonic()
+        elapsed = ended_at - trace.started_at
+        if capture:
+            try:
+                if elapsed >= settings.slow_request_threshold:
+                    await _dump_slow_request(trace, ended_at)
+            finally:
+                # Released after the dump, as the last release drops the samples
+                sampler.release()
+
+
+async def _dump_slow_request(trace: RequestTrace, ended_at: float) -> None:
+    elapsed = ended_at - trace.started_at
+    totals: defaultdict[str, float] = defaultdict(float)
+    for stage, _, duration in trace.stages:
+        totals[stage] += duration
+    report = {
+        "name": trace.name,
+        "info": trace.info,
+        "elapsed": round(elapsed, 4),
+        "stage_totals": {
+            stage: round(total, 4)
+            for stage, total in sorted(totals.items(), key=lambda item: item[1], reverse=True)
+        },
+        "stages": [
+            {"stage": stage, "start": start, "duration": duration}
+            for stage, start, duration in trace.stages
+        ],
+        "loop_lag": lag_monitor.events_between(trace.started_at, ended_at),
+        "stack_samples": dict(sampler.samples_between(trace.started_at, ended_at).most_common()),
+    }
+    path = Path(settings.profiling_dir) / f"slow-{_timestamp()}-{id(trace):x}.json"
+    logger.warning(f"Slow request {trace.name} took {elapsed:.2f}s, dumping profile to {path}")
+    try:
+        await asyncio.to_thread(_write, path, json.dumps(report, indent=2, default=str))
+    except OSError as e:
+        logger.error(f"Failed to write slow request dump: {e}")
+
+
+def start() -> None:
+    """Start the opt-in profiling surface; call from the running event loop"""
+    if settings.loop_lag_threshold > 0:
+        lag_monitor.start()
+        logger.info(f"Event loop lag monitor started (threshold {settings.loop_lag_threshold}s)")
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR2, toggle_profiler)
+    except (NotImplementedError, AttributeError):
+        logger.warning("SIGUSR2 is not available, the sampling profiler cannot be toggled")
+    if settings.profiler_enabled:
+        toggle_profiler()
+
+
+def stop() -> None:
+    lag_monitor.stop()
+    if sampler.profiling:
+        toggle_profiler()
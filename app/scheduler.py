@@ -0,0 +1,203 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import Counter
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from profiling import timed
+from settings import settings
+from utils import Deadline
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitedError(Exception):
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"rate limit reached, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    Token bucket per key, refilled continuously at `per_minute` tokens a minute.
+    A bucket untouched for a minute is full again, so those are dropped
+    periodically to keep memory bounded by recently active keys.
+    """
+
+    def __init__(self, per_minute: int) -> None:
+        self.per_minute = per_minute
+        self._buckets: dict[int, tuple[float, float]] = {}
+        self._swept_at = time.monotonic()
+
+    def _tokens(self, key: int) -> float:
+        tokens, updated_at = self._buckets.get(key, (self.per_minute, time.monotonic()))
+        refill = (time.monotonic() - updated_at) * self.per_minute / 60
+        return min(self.per_minute, tokens + refill)
+
+    def retry_after(self, key: int) -> float:
+        """Seconds until one token is available, 0 if one is available now"""
+        if self.per_minute <= 0:
+            return 0.0
+        missing = 1 - self._tokens(key)
+        return max(missing, 0.0) * 60 / self.per_minute
+
+    def consume(self, key: int) -> None:
+        if self.per_minute <= 0:
+            return
+        now = time.monotonic()
+        if now - self._swept_at >= 60:
+            self._buckets = {
+                key: bucket for key, bucket in self._buckets.items() if now - bucket[1] < 60
+            }
+            self._swept_at = now
+        self._buckets[key] = (self._tokens(key) - 1, now)
+
+
+class FairScheduler:
+    """
+    Start-time fair queueing of download jobs across chats.
+
+    At most `max_jobs` jobs run at once, at most `chat_concurrency` per chat and
+    at most `user_concurrency` per user, wherever the user posted the links.
+    Waiting jobs are started in order of their virtual start tag, which advances
+    by 1/weight per job for each chat, so a chat that queues fifty links only
+    gets its weighted share of slots while other chats keep being served.
+    """
+
+    def __init__(
+        self,
+        max_jobs: int,
+        chat_concurrency: int,
+        user_concurrency: int,
+        weights: dict[int, float],
+        chat_rate_limit: int,
+        user_rate_limit: int,
+    ) -> None:
+        self.max_jobs = max_jobs
+        self.chat_concurrency = chat_concurrency
+        self.user_concurrency = user_concurrency
+        self.weights = weights
+        self.chat_limiter = RateLimiter(chat_rate_limit)
+        self.user_limiter = RateLimiter(user_rate_limit)
+        self._running: Counter[int] = Counter()
+        self._running_users: Counter[int] = Counter()
+        self._virtual_time = 0.0
+        self._last_finish: dict[int, float] = {}
+        self._waiting: list[tuple[float, int, int, int, asyncio.Future[None]]] = []
+        self._sequence = itertools.count()
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    def admit(self, chat_id: int, user_id: int, count: int) -> tuple[int, float]:
+        """
+        Charge up to `count` links against the chat and user rate limits.
+        Returns how many were admitted and, if any were not, seconds until the next one would be.
+        """
+        for admitted in range(count):
+            retry_after = max(
+                self.chat_limiter.retry_after(chat_id), self.user_limiter.retry_after(user_id)
+            )
+            if retry_after > 0:
+                logger.info(
+                    f"Rate limited chat ID {chat_id} / user ID {user_id}: "
+                    f"{count - admitted} of {count} links rejected"
+                )
+                return admitted, retry_after
+            self.chat_limiter.consume(chat_id)
+            self.user_limiter.consume(user_id)
+        return count, 0.0
+
+    @asynccontextmanager
+    async def slot(
+        self, chat_id: int, user_id: int, timeout: float | None = None
+    ) -> AsyncIterator[None]:
+        """
+        Wait up to `timeout` seconds for a fair-share job slot for `chat_id` and
+        `user_id` and hold it for the duration of the block. The wait is bounded separately
+        from the job itself, whose deadline should start once the slot is held.
+        """
+        with timed("waiting for a download slot"):
+            async with Deadline(timeout).stage("waiting for a download slot"):
+                await self._acquire(chat_id, user_id)
+        try:
+            yield
+        finally:
+            self._release(chat_id, user_id)
+
+    def _can_start(self, chat_id: int, user_id: int) -> bool:
+        return (
+            self.running < self.max_jobs
+            and self._running[chat_id] < self.chat_concurrency
+            and self._running_users[user_id] < self.user_concurrency
+        )
+
+    async def _acquire(self, chat_id: int, user_id: int) -> None:
+        weight = self.weights.get(chat_id, 1.0)
+        start_tag = max(self._virtual_time, self._last_finish.get(chat_id, 0.0))
+        self._last_finish[chat_id] = start_tag + 1 / weight
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (start_tag, next(self._sequence), chat_id, user_id, future))
+        self._dispatch()
+        if not future.done():
+            logger.info(
+                f"Queued job for chat ID {chat_id} ({len(self._waiting)} waiting, {self.running} running)"
+            )
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled
+                self._release(chat_id, user_id)
+            raise
+
+    def _start(self, chat_id: int, user_id: int, start_tag: float) -> None:
+        self._running[chat_id] += 1
+        self._running_users[user_id] += 1
+        self._virtual_time = max(self._virtual_time, start_tag)
+
+    def _release(self, chat_id: int, user_id: int) -> None:
+        for running, key in ((self._running, chat_id), (self._running_users, user_id)):
+            running[key] -= 1
+            if running[key] <= 0:
+                del running[key]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Start waiting jobs in tag order, skipping chats and users that are at their quota"""
+        skipped = []
+        while self._waiting and self.running < self.max_jobs:
+            entry = heapq.heappop(self._waiting)
+            start_tag, _, chat_id, user_id, future = entry
+            if future.done():
+                continue  # Cancelled while waiting
+            if not self._can_start(chat_id, user_id):
+                skipped.append(entry)
+                continue
+            self._start(chat_id, user_id, start_tag)
+            future.set_result(None)
+        for entry in skipped:
+            heapq.heappush(self._waiting, entry)
+
+        # Forget chats that are idle and have no credit left to carry over
+        if not self._waiting:
+            self._last_finish = {
+                chat_id: tag
+                for chat_id, tag in self._last_finish.items()
+                if chat_id in self._running or tag > self._virtual_time
+            }
+
+
+scheduler = FairScheduler(
+    max_jobs=settings.max_concurrent_jobs,
+    chat_concurrency=settings.chat_concurrency,
+    user_concurrency=settings.user_concurrency,
+    weights=settings.priority_chats,
+    chat_rate_limit=settings.chat_rate_limit,
+    user_rate_limit=settings.user_rate_limit,
+)
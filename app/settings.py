@@ -12,12 +12,54 @@ class Settings:
     with_captions: bool
     instagram_username: Optional[str]
     instagram_password: Optional[str]
+    request_timeout: float
+    fetch_timeout: float
+    download_timeout: float
+    process_timeout: float
+    negative_cache_ttl: float
+    negative_cache_transient_ttl: float
+    negative_cache_size: int
+    short_link_cache_ttl: float
+    short_link_cache_size: int
+    message_concurrency: int
+    max_concurrent_jobs: int
+    chat_concurrency: int
+    user_concurrency: int
+    queue_timeout: float
+    chat_rate_limit: int
+    user_rate_limit: int
+    priority_chats: dict[int, float]
+    video_store_dir: str
+    video_store_max_bytes: int
+    profiling_dir: str
+    slow_request_threshold: float
+    loop_lag_threshold: float
+    profiler_interval: float
+    profiler_enabled: bool
 
 
 def parse_env_list(key: str) -> list[int]:
     return list(map(int, json.loads(os.getenv(key, "[]"))))
 
 
+def parse_env_weights(key: str) -> dict[int, float]:
+    weights = {int(k): float(v) for k, v in json.loads(os.getenv(key, "{}")).items()}
+    if invalid := [k for k, v in weights.items() if v <= 0]:
+        raise ValueError(f"{key} weights must be positive, got {invalid}")
+    return weights
+
+
+def parse_env_positive_int(key: str, default: str) -> int:
+    value = int(os.getenv(key, default))
+    if value <= 0:
+        raise ValueError(f"{key} must be positive, got {value}")
+    return value
+
+
+def parse_env_float(key: str, default: str) -> float:
+    return float(os.getenv(key, default))
+
+
 def parse_env_bool(key: str, default: str = "false") -> bool:
     return os.getenv(key, default).lower() in ("yes", "true", "1", "on")
 
@@ -29,4 +71,28 @@ settings = Settings(
     with_captions=parse_env_bool("WITH_CAPTIONS", default="true"),
     instagram_username=os.getenv("INSTAGRAM_USERNAME"),
     instagram_password=os.getenv("INSTAGRAM_PASSWORD"),
+    request_timeout=parse_env_float("REQUEST_TIMEOUT", default="120"),
+    fetch_timeout=parse_env_float("FETCH_TIMEOUT", default="45"),
+    download_timeout=parse_env_float("DOWNLOAD_TIMEOUT", default="60"),
+    process_timeout=parse_env_float("PROCESS_TIMEOUT", default="90"),
+    negative_cache_ttl=parse_env_float("NEGATIVE_CACHE_TTL", default="21600"),
+    negative_cache_transient_ttl=parse_env_float("NEGATIVE_CACHE_TRANSIENT_TTL", default="60"),
+    negative_cache_size=int(os.getenv("NEGATIVE_CACHE_SIZE", "10000")),
+    short_link_cache_ttl=parse_env_float("SHORT_LINK_CACHE_TTL", default="86400"),
+    short_link_cache_size=int(os.getenv("SHORT_LINK_CACHE_SIZE", "10000")),
+    message_concurrency=parse_env_positive_int("MESSAGE_CONCURRENCY", default="3"),
+    max_concurrent_jobs=parse_env_positive_int("MAX_CONCURRENT_JOBS", default="4"),
+    chat_concurrency=parse_env_positive_int("CHAT_CONCURRENCY", default="2"),
+    user_concurrency=parse_env_positive_int("USER_CONCURRENCY", default="2"),
+    queue_timeout=parse_env_float("QUEUE_TIMEOUT", default="300"),
+    chat_rate_limit=int(os.getenv("CHAT_RATE_LIMIT", "30")),
+    user_rate_limit=int(os.getenv("USER_RATE_LIMIT", "20")),
+    priority_chats=parse_env_weights("PRIORITY_CHATS"),
+    video_store_dir=os.getenv("VIDEO_STORE_DIR", "video_store"),
+    video_store_max_bytes=int(os.getenv("VIDEO_STORE_MAX_BYTES", str(1024 ** 3))),
+    profiling_dir=os.getenv("PROFILING_DIR", "profiles"),
+    slow_request_threshold=parse_env_float("SLOW_REQUEST_THRESHOLD", default="0"),
+    loop_lag_threshold=parse_env_float("LOOP_LAG_THRESHOLD", default="0"),
+    profiler_interval=parse_env_float("PROFILER_INTERVAL", default="0.05"),
+    profiler_enabled=parse_env_bool("PROFILER_ENABLED"),
 )
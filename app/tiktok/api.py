@@ -1,22 +1,61 @@
 import asyncio
-from collections.abc import AsyncIterable
 
+import httpx
+
+from cache import negative_cache
 from tiktok.client import AsyncTikTokClient
-from tiktok.data import Tiktok
+from tiktok.data import ResolvedLink, Tiktok
+from utils import Deadline, UnavailableError
 
 
 class TikTokAPI:
     @classmethod
-    async def download_tiktoks(cls, urls: list[str]) -> AsyncIterable[Tiktok]:
-        tasks = [cls.download_tiktok(url) for url in urls]
-        for task in asyncio.as_completed(tasks):
-            tiktok = await task
-            yield tiktok
+    async def resolve_links(
+        cls, urls: list[str], deadline: Deadline | None = None
+    ) -> dict[str, ResolvedLink | None]:
+        """
+        Resolve short links up front so the same video shared twice is fetched once.
+        Returns the first URL for each distinct video, in order, mapped to its link.
+        """
+        async with AsyncTikTokClient() as client:
+            links = await asyncio.gather(*(client.resolve_link(url, deadline) for url in urls))
+        unique: dict[str, tuple[str, ResolvedLink | None]] = {}
+        for url, link in zip(urls, links):
+            unique.setdefault(link.video_id if link else url, (url, link))
+        return dict(unique.values())
 
     @classmethod
-    async def download_tiktok(cls, url: str) -> Tiktok:
+    async def download_tiktok(
+        cls,
+        url: str,
+        deadline: Deadline | None = None,
+        link: ResolvedLink | None = None,
+        resolve: bool = True,
+    ) -> Tiktok:
+        """
+        Pass resolve=False when `link` comes from an earlier resolution attempt,
+        even one that found nothing, so the redirects are not followed twice.
+        Raises UnavailableError if the video is gone, private or has no video,
+        and TemporarilyUnavailableError if it failed transiently moments ago.
+        """
         async with AsyncTikTokClient() as client:
-            if (item := await client.get_page_data(url=url)) and item.video_url:
-                video = await client.get_video(url=item.video_url)
-                return Tiktok(url=url, description=item.description, video=video)
-            return Tiktok()
+            if link is None and resolve:
+                link = await client.resolve_link(url, deadline)
+            cache_key = f"tiktok:{link.video_id if link else url}"
+            negative_cache.check(cache_key)
+
+            try:
+                item = await client.get_page_data(url=link.url if link else url, deadline=deadline)
+                if not item:
+                    raise UnavailableError("could not find the video data")
+                if not item.video_url:
+                    raise UnavailableError("no video found")
+                video = await client.get_video(url=item.video_url, deadline=deadline)
+            except UnavailableError as e:
+                negative_cache.record(cache_key, e.reason)
+                raise
+            except httpx.HTTPError as e:
+                # Blocks, expired URLs and outages are not proof the video is gone
+                negative_cache.record_error(cache_key, e)
+                raise
+            return Tiktok(url=url, description=item.description, video=video)
@@ -3,15 +3,40 @@ import random
 import string
 import logging
 from datetime import UTC, datetime
+from urllib.parse import parse_qs, urlparse
 
 import httpx
 from bs4 import BeautifulSoup
 
-from tiktok.data import ItemStruct
-from utils import DifferentPageError, NoDataError, NoScriptError, retries
+from cache import short_link_cache
+from profiling import timed
+from settings import settings
+from tiktok.data import ItemStruct, ResolvedLink
+from utils import (
+    Deadline,
+    DifferentPageError,
+    NoDataError,
+    NoScriptError,
+    UnavailableError,
+    retries,
+)
 
 logger = logging.getLogger(__name__)
 
+MAX_REDIRECTS = 5
+
+
+def extract_video_id(url: str) -> str | None:
+    """Return the numeric video id from a full TikTok URL, or None for short links"""
+    parsed_url = urlparse(url)
+    page_id = parsed_url.path.rstrip("/").rsplit("/", 1)[-1]
+    if page_id.isdigit():
+        return page_id
+    share_item_id = parse_qs(parsed_url.query).get("share_item_id", [None])[0]
+    if share_item_id and share_item_id.isdigit():
+        return share_item_id
+    return None
+
 
 class AsyncTikTokClient(httpx.AsyncClient):
     def __init__(self) -> None:
@@ -34,23 +59,73 @@ class AsyncTikTokClient(httpx.AsyncClient):
             follow_redirects=True,
         )
 
+    async def resolve_link(self, url: str, deadline: Deadline | None = None) -> ResolvedLink | None:
+        """
+        Resolve a TikTok URL to its numeric video id without downloading the page.
+        Short links are followed hop by hop with HEAD requests (falling back to a
+        GET whose body is never read) and the result is cached.
+        Returns None if no video id could be found.
+        """
+        if video_id := extract_video_id(url):
+            return ResolvedLink(video_id=video_id, url=url)
+
+        parsed_url = urlparse(url)
+        cache_key = f"{parsed_url.netloc.lower()}{parsed_url.path.rstrip('/')}"
+        if link := short_link_cache.get(cache_key):
+            logger.info(f"Short link cache hit: {url} -> {link.video_id}")
+            return link
+
+        try:
+            async with (deadline or Deadline()).stage("tiktok link resolution", settings.fetch_timeout):
+                link = await self._follow_redirects(url)
+        except httpx.HTTPError as e:
+            logger.warning(f"Failed to resolve TikTok link {url}: {e}")
+            return None
+
+        if link:
+            logger.info(f"Resolved {url} -> {link.video_id}")
+            short_link_cache.set(cache_key, link, settings.short_link_cache_ttl)
+        return link
+
+    async def _follow_redirects(self, url: str) -> ResolvedLink | None:
+        current = httpx.URL(url)
+        for _ in range(MAX_REDIRECTS):
+            location = None
+            resp = await self.head(current, follow_redirects=False)
+            if resp.is_redirect:
+                location = resp.headers["Location"]
+            else:
+                # Some edges reject HEAD; only the status line and headers are needed
+                async with self.stream("GET", current, follow_redirects=False) as resp:
+                    if resp.is_redirect:
+                        location = resp.headers["Location"]
+            if location is None:
+                return None
+
+            current = current.join(location)
+            if video_id := extract_video_id(str(current)):
+                return ResolvedLink(video_id=video_id, url=str(current))
+        return None
+
+    async def get_page_data(self, url: str, deadline: Deadline | None = None) -> ItemStruct | None:
+        async with (deadline or Deadline()).stage("tiktok page fetch", settings.fetch_timeout):
+            return await self._get_page_data(url)
+
     @retries(times=3)
-    async def get_page_data(self, url: str) -> ItemStruct:
-        page = await self.get(url)
+    async def _get_page_data(self, url: str) -> ItemStruct:
+        with timed("tiktok page request"):
+            page = await self.get(url)
         logger.info(f"TikTok redirected URL: {page.url}")
+        if page.status_code in (404, 410):
+            raise UnavailableError("not found")
+        # Anything else (403 anti-bot/geo blocks, 429, 5xx) is cached only as a transient failure
+        page.raise_for_status()
 
         # Extract video ID from the URL
-        page_id = page.url.path.rsplit("/", 1)[-1]
-        if not page_id.isdigit():
-            # Try to extract from query parameters
-            from urllib.parse import parse_qs, urlparse
-            parsed_url = urlparse(str(page.url))
-            query_params = parse_qs(parsed_url.query)
-            share_item_id = query_params.get('share_item_id', [None])[0]
-            if share_item_id:
-                page_id = share_item_id
-
-        soup = BeautifulSoup(page.text, "html.parser")
+        page_id = extract_video_id(str(page.url))
+
+        with timed("tiktok html parse"):
+            soup = BeautifulSoup(page.text, "html.parser")
 
         # Try different script tags that might contain the video data
         scripts = [
@@ -64,13 +139,19 @@ class AsyncTikTokClient(httpx.AsyncClient):
                 continue
 
             try:
-                data = json.loads(script.text)
+                with timed("tiktok json decode"):
+                    data = json.loads(script.text)
 
                 # Try different known data structures
                 try:
                     # New structure
                     if "webapp.video-detail" in str(data):
-                        item_data = data["__DEFAULT_SCOPE__"]["webapp.video-detail"]["itemInfo"]["itemStruct"]
+                        video_detail = data["__DEFAULT_SCOPE__"]["webapp.video-detail"]
+                        # Deleted and private videos come back with a non-zero status code
+                        if status_code := video_detail.get("statusCode"):
+                            raise UnavailableError(
+                                video_detail.get("statusMsg") or f"status code {status_code}")
+                        item_data = video_detail["itemInfo"]["itemStruct"]
                     # Alternative structure
                     elif "ItemModule" in str(data):
                         item_data = next(
@@ -86,11 +167,15 @@ class AsyncTikTokClient(httpx.AsyncClient):
             except json.JSONDecodeError:
                 continue
 
-        raise NoDataError("Could not find video data in any known structure")
+        logger.warning("Could not find video data in any known structure")
+        raise NoDataError
 
-    async def get_video(self, url: str) -> bytes | None:
-        resp = await self.get(url)
+    async def get_video(self, url: str, deadline: Deadline | None = None) -> bytes | None:
+        async with (deadline or Deadline()).stage("tiktok video download", settings.download_timeout):
+            with timed("tiktok video request"):
+                resp = await self.get(url)
         if resp.is_error:
             logger.error(f"Failed to download video: {resp.status_code}")
             return None
-        return resp.content
+        video: bytes = resp.content
+        return video
@@ -12,6 +12,12 @@ class Tiktok:
         return f"{self.description}\n\n{self.url}"
 
 
+@dataclass
+class ResolvedLink:
+    video_id: str
+    url: str
+
+
 @dataclass
 class ItemStruct:
     page_id: str
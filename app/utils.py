@@ -1,6 +1,8 @@
 import asyncio
 import logging
-from collections.abc import Awaitable, Callable
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
 from functools import wraps
 from typing import ParamSpec, TypeVar
 
@@ -24,6 +26,75 @@ class DifferentPageError(RetryingError):
         super().__init__("tiktok_id is different from page_id")
 
 
+class UnavailableError(Exception):
+    """The linked video is gone, private or has no video; retrying will not help"""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+
+class TemporarilyUnavailableError(Exception):
+    """The link failed moments ago for a reason that may not last, e.g. an upstream outage"""
+
+    def __init__(self) -> None:
+        super().__init__("temporarily unavailable, please try again in a minute")
+
+
+class DeadlineExceededError(TimeoutError):
+    def __init__(self, stage: str) -> None:
+        super().__init__(f"deadline exceeded during {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """
+    Per-request time budget shared by every stage of the pipeline.
+
+    Stages run inside `deadline.stage(name, limit)`, which bounds them by the
+    smaller of the stage limit and the time left on the request. When either
+    runs out the awaiting task is cancelled, which aborts in-flight HTTP
+    transfers and lets subprocess owners kill their children.
+    """
+
+    def __init__(self, timeout: float | None = None) -> None:
+        self.expires_at = None if timeout is None else time.monotonic() + timeout
+
+    def remaining(self) -> float | None:
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() == 0.0
+
+    def timeout(self, limit: float | None = None) -> float | None:
+        """Seconds a stage may take: the stage limit capped by the time left"""
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        if limit is None:
+            return remaining
+        return min(remaining, limit)
+
+    def check(self, stage: str) -> None:
+        if self.expired:
+            raise DeadlineExceededError(stage)
+
+    @asynccontextmanager
+    async def stage(self, name: str, limit: float | None = None) -> AsyncIterator[None]:
+        self.check(name)
+        scope = asyncio.timeout(self.timeout(limit))
+        try:
+            async with scope:
+                yield
+        except TimeoutError:
+            if scope.expired():
+                raise DeadlineExceededError(name) from None
+            raise
+
+
 P = ParamSpec("P")
 T = TypeVar("T")
 
@@ -1,3 +1,5 @@
+import asyncio
+import json
 import logging
 import tempfile
 import os
@@ -6,6 +8,11 @@ import time
 from typing import Tuple
 from humanize import naturalsize
 
+from profiling import timed
+from settings import settings
+from utils import Deadline
+from video_store import VideoStore, get_video_store
+
 logger = logging.getLogger(__name__)
 
 
@@ -35,7 +42,37 @@ def get_video_details(probe_data: dict) -> dict:
         return {}
 
 
-def is_video_compatible(video_path: str) -> Tuple[bool, dict]:
+async def run_ffmpeg(args: list[str]) -> bytes:
+    """
+    Run an ffmpeg/ffprobe command without blocking the event loop.
+    The child process is killed if the awaiting task is cancelled,
+    e.g. when the request deadline expires.
+    Returns captured stdout, raises ffmpeg.Error on a non-zero exit.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    try:
+        with timed(args[0]):
+            stdout, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        logger.warning(f"Killing cancelled {args[0]} process {proc.pid}")
+        proc.kill()
+        await proc.wait()
+        raise
+    if proc.returncode != 0:
+        raise ffmpeg.Error(args[0], stdout, stderr)
+    return stdout
+
+
+async def probe(video_path: str) -> dict:
+    """Async equivalent of ffmpeg.probe"""
+    stdout = await run_ffmpeg(
+        ['ffprobe', '-show_format', '-show_streams', '-of', 'json', video_path])
+    probe_data: dict = json.loads(stdout.decode('utf-8'))
+    return probe_data
+
+
+async def is_video_compatible(video_path: str) -> Tuple[bool, dict]:
     """
     Check if video is already in a compatible format for Telegram.
     Returns (is_compatible, video_info)
@@ -44,8 +81,8 @@ def is_video_compatible(video_path: str) -> Tuple[bool, dict]:
         start_time = time.time()
         logger.info(f"Analyzing video file: {video_path}")
 
-        probe = ffmpeg.probe(video_path)
-        video_details = get_video_details(probe)
+        probe_data = await probe(video_path)
+        video_details = get_video_details(probe_data)
 
         # Log detailed video information
         logger.info("Video details:")
@@ -75,17 +112,47 @@ def is_video_compatible(video_path: str) -> Tuple[bool, dict]:
         logger.info(f"  Overall compatible: {is_compatible}")
 
         return is_compatible, video_details
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         logger.warning(f"Error checking video compatibility: {e}")
         return False, {}
 
 
-async def process_video_file(video_data: bytes, filename: str) -> Tuple[bytes, int, int]:
+async def process_video_file(
+    video_data: bytes, filename: str, deadline: Deadline | None = None
+) -> Tuple[bytes, int, int]:
     """
     Process video to ensure correct format for Telegram.
     Optimized to skip processing if video is already compatible.
+    Bounded by settings.process_timeout and the request deadline; ffmpeg is
+    killed if either expires.
+    Results are kept in the video store, keyed by a hash of the source bytes,
+    so the same clip is only processed once whatever URL it arrived from.
     Returns tuple of (processed_video_bytes, width, height)
     """
+    async with (deadline or Deadline()).stage("video processing", settings.process_timeout):
+        video_store = get_video_store()
+        if video_store is None:
+            processed_data, width, height, _ = await _process_video_file(video_data, filename)
+            return processed_data, width, height
+
+        with timed("video store lookup"):
+            key = await asyncio.to_thread(VideoStore.key, video_data)
+        if cached := await video_store.get(key):
+            processed_data, stored = cached
+            logger.info(
+                f"Video store hit for {filename} ({key[:12]}), "
+                f"hit rate {video_store.hit_rate:.1%}")
+            return processed_data, stored.width, stored.height
+
+        processed_data, width, height, duration = await _process_video_file(video_data, filename)
+        await video_store.put(key, processed_data, width, height, duration)
+        logger.info(f"Video store stats: {video_store.stats()}")
+        return processed_data, width, height
+
+
+async def _process_video_file(video_data: bytes, filename: str) -> Tuple[bytes, int, int, float]:
     start_time = time.time()
     logger.info(f"Starting video processing for {filename}")
     logger.info(f"Input video size: {naturalsize(len(video_data))}")
@@ -95,9 +162,13 @@ async def process_video_file(video_data: bytes, filename: str) -> Tuple[bytes, i
         temp_in.flush()
         logger.info(f"Temporary input file created: {temp_in.name}")
 
+        # Create a temporary output file
+        temp_out = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
+        temp_out.close()
+
         try:
             # Check if video needs processing
-            is_compatible, video_info = is_video_compatible(temp_in.name)
+            is_compatible, video_info = await is_video_compatible(temp_in.name)
             width = video_info.get('width', 0)
             height = video_info.get('height', 0)
 
@@ -105,12 +176,9 @@ async def process_video_file(video_data: bytes, filename: str) -> Tuple[bytes, i
                 process_time = time.time() - start_time
                 logger.info(
                     f"Video is already compatible, processing completed in {process_time:.2f}s")
-                return video_data, width, height
+                return video_data, width, height, video_info.get('duration', 0.0)
 
             logger.info("Video needs conversion, starting FFmpeg process...")
-            # Create a temporary output file
-            temp_out = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
-            temp_out.close()
 
             # Process video while maintaining aspect ratio
             stream = ffmpeg.input(temp_in.name)
@@ -129,8 +197,7 @@ async def process_video_file(video_data: bytes, filename: str) -> Tuple[bytes, i
             # Run FFmpeg with progress logging
             conversion_start = time.time()
             logger.info("Starting FFmpeg conversion...")
-            ffmpeg.run(stream, capture_stdout=True,
-                       capture_stderr=True, overwrite_output=True)
+            await run_ffmpeg(ffmpeg.compile(stream, overwrite_output=True))
             conversion_time = time.time() - conversion_start
             logger.info(
                 f"FFmpeg conversion completed in {conversion_time:.2f}s")
@@ -140,7 +207,7 @@ async def process_video_file(video_data: bytes, filename: str) -> Tuple[bytes, i
                 processed_data = f.read()
 
             # Log final video details
-            final_details = get_video_details(ffmpeg.probe(temp_out.name))
+            final_details = get_video_details(await probe(temp_out.name))
             logger.info("Processed video details:")
             logger.info(f"  Size: {naturalsize(len(processed_data))}")
             logger.info(f"  Duration: {final_details['duration']:.2f}s")
@@ -151,8 +218,8 @@ async def process_video_file(video_data: bytes, filename: str) -> Tuple[bytes, i
             total_time = time.time() - start_time
             logger.info(f"Total processing time: {total_time:.2f}s")
 
-            os.unlink(temp_out.name)
-            return processed_data, width, height
+            return processed_data, width, height, final_details['duration']
 
         finally:
             os.unlink(temp_in.name)
+            os.unlink(temp_out.name)
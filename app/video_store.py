@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from humanize import naturalsize
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StoredVideo:
+    width: int
+    height: int
+    duration: float
+    size: int
+
+
+class VideoStore:
+    """
+    On-disk cache of processed videos keyed by the SHA-256 of the source bytes,
+    so the same clip reposted under another URL or platform is not transcoded again.
+    Each entry is `<key>.mp4` plus `<key>.json` metadata. Entries are evicted
+    least recently used first once their total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, StoredVideo] = OrderedDict()
+        self._total_bytes = 0
+        self._writes: dict[str, asyncio.Task[None]] = {}
+        self._load()
+
+    @staticmethod
+    def key(video_data: bytes) -> str:
+        return hashlib.sha256(video_data).hexdigest()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 3),
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+        }
+
+    def _paths(self, key: str) -> tuple[Path, Path]:
+        return self.directory / f"{key}.mp4", self.directory / f"{key}.json"
+
+    def _load(self) -> None:
+        """Index existing entries, oldest access first"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for meta_path in self.directory.glob("*.json"):
+            video_path = meta_path.with_suffix(".mp4")
+            try:
+                stored = StoredVideo(**json.loads(meta_path.read_text()))
+                entries.append((video_path.stat().st_mtime, meta_path.stem, stored))
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning(f"Dropping unreadable video store entry {meta_path.stem}: {e}")
+                self._unlink(meta_path.stem)
+        for _, key, stored in sorted(entries, key=lambda entry: entry[0]):
+            self._entries[key] = stored
+            self._total_bytes += stored.size
+        logger.info(
+            f"Video store at {self.directory}: {len(self._entries)} entries, "
+            f"{naturalsize(self._total_bytes)} of {naturalsize(self.max_bytes)}"
+        )
+        self._evict()
+
+    def _unlink(self, key: str) -> None:
+        for path in self._paths(key):
+            path.unlink(missing_ok=True)
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, stored = self._entries.popitem(last=False)
+            self._total_bytes -= stored.size
+            self._unlink(key)
+            logger.info(f"Evicted {key} ({naturalsize(stored.size)}) from video store")
+
+    def _read(self, key: str) -> bytes:
+        video_path, _ = self._paths(key)
+        data = video_path.read_bytes()
+        os.utime(video_path)  # Keep LRU order across restarts
+        return data
+
+    def _write(self, key: str, data: bytes, stored: StoredVideo) -> None:
+        video_path, meta_path = self._paths(key)
+        for path, content in ((video_path, data), (meta_path, json.dumps(asdict(stored)).encode())):
+            # A unique temp file, so a reader never sees another writer's partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{key}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as tmp_file:
+                    tmp_file.write(content)
+                os.replace(tmp_path, path)
+            except BaseException:
+                Path(tmp_path).unlink(missing_ok=True)
+                raise
+
+    async def get(self, key: str) -> tuple[bytes, StoredVideo] | None:
+        stored = self._entries.get(key)
+        if stored is None:
+            self.misses += 1
+            return None
+        try:
+            data = await asyncio.to_thread(self._read, key)
+        except OSError as e:
+            logger.warning(f"Video store entry {key} is unreadable: {e}")
+            # Unless it was evicted, and its size subtracted, while we were reading it
+            if self._entries.pop(key, None) is not None:
+                self._total_bytes -= stored.size
+            self.misses += 1
+            return None
+        # The entry may have been evicted while we were reading it
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self.hits += 1
+        return data, stored
+
+    async def put(self, key: str, data: bytes, width: int, height: int, duration: float) -> None:
+        if len(data) > self.max_bytes or key in self._entries:
+            return
+        # Concurrent misses for the same source share a single write
+        write = self._writes.get(key)
+        if write is None:
+            stored = StoredVideo(width=width, height=height, duration=duration, size=len(data))
+            write = asyncio.create_task(self._store(key, data, stored))
+            self._writes[key] = write
+            write.add_done_callback(lambda _: self._writes.pop(key, None))
+        await asyncio.shield(write)
+
+    async def _store(self, key: str, data: bytes, stored: StoredVideo) -> None:
+        try:
+            await asyncio.to_thread(self._write, key, data, stored)
+        except OSError as e:
+            logger.warning(f"Failed to store processed video {key}: {e}")
+            return
+        if key not in self._entries:
+            self._entries[key] = stored
+            self._total_bytes += stored.size
+            self._evict()
+
+
+_video_store: VideoStore | None = None
+
+
+def get_video_store() -> VideoStore | None:
+    """
+    Return the shared store, creating it on first use so that importing this
+    module does not touch the filesystem. None if the store is disabled.
+    """
+    global _video_store
+    if _video_store is None and settings.video_store_dir and settings.video_store_max_bytes > 0:
+        _video_store = VideoStore(Path(settings.video_store_dir), settings.video_store_max_bytes)
+    return _video_store
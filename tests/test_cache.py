@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+
+import cache
+from cache import TTLCache
+
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now))
+    ttl_cache: TTLCache[str, int] = TTLCache(maxsize=10)
+    ttl_cache.set("short", 1, ttl=10)
+    ttl_cache.set("long", 2, ttl=100)
+
+    now += 50
+
+    assert ttl_cache.get("short") is None
+    assert ttl_cache.get("long") == 2
+    assert len(ttl_cache) == 1
+
+
+def test_least_recently_used_entry_is_dropped():
+    ttl_cache: TTLCache[str, int] = TTLCache(maxsize=2)
+    ttl_cache.set("a", 1, ttl=60)
+    ttl_cache.set("b", 2, ttl=60)
+    ttl_cache.get("a")
+    ttl_cache.set("c", 3, ttl=60)
+
+    assert ttl_cache.get("b") is None
+    assert ttl_cache.get("a") == 1
+    assert ttl_cache.get("c") == 3
@@ -0,0 +1,29 @@
+import io
+
+from core import read_urls, write_video
+
+
+def test_read_urls_skips_blanks_comments_and_duplicates():
+    source = io.StringIO(
+        "# links\n"
+        "https://vm.tiktok.com/ZMabc/\n"
+        "\n"
+        "www.instagram.com/reel/ABC123/\n"
+        "https://vm.tiktok.com/ZMabc/\n"
+    )
+
+    assert read_urls(source) == [
+        "https://vm.tiktok.com/ZMabc/",
+        "https://www.instagram.com/reel/ABC123/",
+    ]
+
+
+def test_write_video_names_files_by_content(tmp_path):
+    first = write_video(tmp_path, "tiktok", b"first video")
+    second = write_video(tmp_path, "tiktok", b"second video")
+    again = write_video(tmp_path, "tiktok", b"first video")
+
+    assert first != second
+    assert again == first
+    assert first.read_bytes() == b"first video"
+    assert second.read_bytes() == b"second video"
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+import instaloader
+import pytest
+
+import instagram
+from cache import negative_cache
+from utils import UnavailableError
+
+
+def test_concurrent_session_refreshes_log_in_once(monkeypatch):
+    logins: list[bool] = []
+
+    def fake_login(force_new: bool) -> bool:
+        time.sleep(0.05)
+        logins.append(force_new)
+        return True
+
+    monkeypatch.setattr(instagram, "_login", fake_login)
+
+    async def run() -> list[bool]:
+        return await asyncio.gather(
+            *(instagram.login_to_instagram(force_new=True) for _ in range(3))
+        )
+
+    assert asyncio.run(run()) == [True, True, True]
+    assert logins == [True]
+
+
+def test_missing_post_metadata_is_unavailable(monkeypatch):
+    calls: list[str] = []
+
+    def from_shortcode(context: object, shortcode: str) -> None:
+        calls.append(shortcode)
+        raise instaloader.exceptions.BadResponseException("Fetching Post metadata failed.")
+
+    monkeypatch.setattr(instaloader.Post, "from_shortcode", from_shortcode)
+    url = "https://www.instagram.com/reel/DEADREEL/"
+
+    with pytest.raises(UnavailableError):
+        asyncio.run(instagram.download_reel(url, "DEADREEL"))
+
+    assert calls == ["DEADREEL"]
+    failure = negative_cache.get("instagram:DEADREEL")
+    assert failure is not None and not failure.transient
+    negative_cache.forget("instagram:DEADREEL")
@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+import pytest
+
+from cache import negative_cache
+from tiktok.api import TikTokAPI
+from tiktok.client import AsyncTikTokClient
+from utils import TemporarilyUnavailableError, UnavailableError
+
+URL = "https://www.tiktok.com/@user/video/7000000000000000001"
+
+
+def raising(error: Exception):
+    async def get_page_data(self, url, deadline=None):
+        raise error
+
+    return get_page_data
+
+
+def test_forbidden_page_is_cached_as_transient(monkeypatch):
+    request = httpx.Request("GET", URL)
+    error = httpx.HTTPStatusError(
+        "403 Forbidden", request=request, response=httpx.Response(403, request=request)
+    )
+    monkeypatch.setattr(AsyncTikTokClient, "get_page_data", raising(error))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(TikTokAPI.download_tiktok(URL))
+
+    failure = negative_cache.get("tiktok:7000000000000000001")
+    assert failure is not None and failure.transient
+    negative_cache.forget("tiktok:7000000000000000001")
+
+
+def test_unavailable_video_is_cached_as_terminal(monkeypatch):
+    monkeypatch.setattr(AsyncTikTokClient, "get_page_data", raising(UnavailableError("private")))
+
+    with pytest.raises(UnavailableError):
+        asyncio.run(TikTokAPI.download_tiktok(URL))
+
+    failure = negative_cache.get("tiktok:7000000000000000001")
+    assert failure is not None and not failure.transient
+    negative_cache.forget("tiktok:7000000000000000001")
+
+
+def test_terminal_hit_keeps_the_reason(monkeypatch):
+    monkeypatch.setattr(AsyncTikTokClient, "get_page_data", raising(UnavailableError("private")))
+    with pytest.raises(UnavailableError):
+        asyncio.run(TikTokAPI.download_tiktok(URL))
+
+    monkeypatch.setattr(AsyncTikTokClient, "get_page_data", raising(AssertionError("fetched")))
+    with pytest.raises(UnavailableError) as excinfo:
+        asyncio.run(TikTokAPI.download_tiktok(URL))
+
+    assert excinfo.value.reason == "private"
+    negative_cache.forget("tiktok:7000000000000000001")
+
+
+def test_transient_hit_hides_the_error_message(monkeypatch):
+    signed_url = "https://cdn.example.com/video.mp4?signature=secret"
+    request = httpx.Request("GET", signed_url)
+    error = httpx.HTTPStatusError(
+        f"Server error '503' for url '{signed_url}'",
+        request=request,
+        response=httpx.Response(503, request=request),
+    )
+    monkeypatch.setattr(AsyncTikTokClient, "get_page_data", raising(error))
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(TikTokAPI.download_tiktok(URL))
+
+    with pytest.raises(TemporarilyUnavailableError) as excinfo:
+        asyncio.run(TikTokAPI.download_tiktok(URL))
+
+    assert "secret" not in str(excinfo.value)
+    failure = negative_cache.get("tiktok:7000000000000000001")
+    assert failure is not None and failure.reason == "HTTP 503"
+    negative_cache.forget("tiktok:7000000000000000001")
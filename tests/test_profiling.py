@@ -0,0 +1,18 @@
+import time
+
+from profiling import StackSampler
+
+
+def test_samples_are_aggregated_per_second_and_dropped_on_release():
+    sampler = StackSampler(interval=0.01)
+    started_at = time.monotonic()
+    sampler.acquire()
+    time.sleep(0.2)
+
+    counts = sampler.samples_between(started_at, time.monotonic())
+    assert sum(counts.values()) > 1
+    assert len(sampler.samples) <= 2
+    assert any("test_samples_are_aggregated" in stack for stack in counts)
+
+    sampler.release()
+    assert not sampler.samples
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+import scheduler as scheduler_module
+from scheduler import FairScheduler, RateLimiter
+from settings import parse_env_positive_int, parse_env_weights
+
+
+def test_rate_limiter_drops_refilled_buckets(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(scheduler_module.time, "monotonic", lambda: now)
+    limiter = RateLimiter(per_minute=2)
+    for key in range(100):
+        limiter.consume(key)
+
+    now += 61
+    limiter.consume(-1)
+
+    assert list(limiter._buckets) == [-1]
+    assert limiter.retry_after(0) == 0.0
+
+
+def test_rate_limiter_reports_retry_after():
+    limiter = RateLimiter(per_minute=2)
+    limiter.consume(1)
+    limiter.consume(1)
+
+    assert 0 < limiter.retry_after(1) <= 30
+
+
+def test_parse_env_weights_rejects_non_positive(monkeypatch):
+    monkeypatch.setenv("PRIORITY_CHATS", '{"1": 2, "2": 0}')
+
+    with pytest.raises(ValueError):
+        parse_env_weights("PRIORITY_CHATS")
+
+
+def test_slot_wait_is_bounded_by_queue_timeout():
+    async def run() -> None:
+        scheduler = FairScheduler(1, 1, 1, {}, 0, 0)
+        async with scheduler.slot(1, 1):
+            with pytest.raises(TimeoutError):
+                async with scheduler.slot(2, 2, timeout=0.05):
+                    pass
+        # The timed-out waiter must not hold on to a slot
+        async with scheduler.slot(2, 2, timeout=0.05):
+            assert scheduler.running == 1
+
+    asyncio.run(run())
+
+
+def test_slots_are_shared_fairly_between_chats():
+    async def run() -> list[int]:
+        scheduler = FairScheduler(1, 1, 1, {}, 0, 0)
+        order: list[int] = []
+
+        async def job(chat_id: int) -> None:
+            async with scheduler.slot(chat_id, chat_id):
+                order.append(chat_id)
+                await asyncio.sleep(0)
+
+        busy = [asyncio.create_task(job(1)) for _ in range(4)]
+        await asyncio.sleep(0)
+        await asyncio.gather(*busy, job(2))
+        return order
+
+    order = asyncio.run(run())
+    assert order.index(2) < 3
+
+
+@pytest.mark.parametrize("value", ["0", "-1"])
+def test_parse_env_positive_int_rejects_non_positive(monkeypatch, value):
+    monkeypatch.setenv("CHAT_CONCURRENCY", value)
+
+    with pytest.raises(ValueError):
+        parse_env_positive_int("CHAT_CONCURRENCY", default="2")
+
+
+def test_user_concurrency_is_bounded_across_chats():
+    async def run() -> int:
+        scheduler = FairScheduler(10, 10, 2, {}, 0, 0)
+        running = peak = 0
+
+        async def job(chat_id: int) -> None:
+            nonlocal running, peak
+            async with scheduler.slot(chat_id, 42):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(job(chat_id) for chat_id in range(6)))
+        return peak
+
+    assert asyncio.run(run()) == 2
@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import cache
+import tiktok.client as client_module
+from cache import TTLCache
+from tiktok.api import TikTokAPI
+from tiktok.client import MAX_REDIRECTS, AsyncTikTokClient
+from utils import UnavailableError
+
+SHORT_URL = "https://vm.tiktok.com/ZMabc/"
+VIDEO_URL = "https://www.tiktok.com/@user/video/7000000000000000002"
+
+
+def resolve(handler, url: str = SHORT_URL):
+    async def run():
+        async with AsyncTikTokClient() as client:
+            client._transport = httpx.MockTransport(handler)
+            return await client.resolve_link(url)
+
+    return asyncio.run(run())
+
+
+@pytest.fixture(autouse=True)
+def empty_short_link_cache(monkeypatch):
+    monkeypatch.setattr(client_module, "short_link_cache", TTLCache(10))
+
+
+def test_falls_back_to_get_when_head_is_rejected():
+    methods: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        methods.append(request.method)
+        if request.method == "HEAD":
+            return httpx.Response(405)
+        return httpx.Response(301, headers={"Location": VIDEO_URL})
+
+    link = resolve(handler)
+
+    assert link is not None and link.video_id == "7000000000000000002"
+    assert methods == ["HEAD", "GET"]
+
+
+def test_gives_up_after_max_redirects():
+    hops = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal hops
+        hops += 1
+        return httpx.Response(302, headers={"Location": f"https://vm.tiktok.com/ZM{hops}/"})
+
+    assert resolve(handler) is None
+    assert hops == MAX_REDIRECTS
+
+
+def test_resolved_links_are_cached_until_they_expire(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now))
+    requests = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal requests
+        requests += 1
+        return httpx.Response(301, headers={"Location": VIDEO_URL})
+
+    resolve(handler)
+    resolve(handler)
+    assert requests == 1
+
+    now += client_module.settings.short_link_cache_ttl + 1
+    resolve(handler)
+    assert requests == 2
+
+
+def test_download_does_not_resolve_again(monkeypatch):
+    async def resolve_link(self, url, deadline=None):
+        raise AssertionError("resolved again")
+
+    async def get_page_data(self, url, deadline=None):
+        raise UnavailableError("not found")
+
+    monkeypatch.setattr(AsyncTikTokClient, "resolve_link", resolve_link)
+    monkeypatch.setattr(AsyncTikTokClient, "get_page_data", get_page_data)
+
+    with pytest.raises(UnavailableError):
+        asyncio.run(TikTokAPI.download_tiktok(SHORT_URL, resolve=False))
+    cache.negative_cache.forget(f"tiktok:{SHORT_URL}")
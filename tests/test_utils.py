@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from utils import Deadline, DeadlineExceededError
+
+
+def test_stage_limit_shorter_than_deadline():
+    async def run() -> None:
+        async with Deadline(10).stage("fetch", 0.01):
+            await asyncio.sleep(1)
+
+    with pytest.raises(DeadlineExceededError) as excinfo:
+        asyncio.run(run())
+    assert excinfo.value.stage == "fetch"
+
+
+def test_deadline_shorter_than_stage_limit():
+    deadline = Deadline(0.01)
+
+    async def run() -> None:
+        async with deadline.stage("download", 10):
+            await asyncio.sleep(1)
+
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(run())
+    assert deadline.expired
+
+
+def test_expired_deadline_fails_before_the_stage_runs():
+    deadline = Deadline(0)
+    ran = False
+
+    async def run() -> None:
+        nonlocal ran
+        async with deadline.stage("process"):
+            ran = True
+
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(run())
+    assert not ran
+
+
+def test_unrelated_timeouts_are_not_mapped():
+    async def run() -> None:
+        async with Deadline(10).stage("fetch", 10):
+            raise TimeoutError("upstream")
+
+    with pytest.raises(TimeoutError) as excinfo:
+        asyncio.run(run())
+    assert not isinstance(excinfo.value, DeadlineExceededError)
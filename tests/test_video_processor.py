@@ -0,0 +1,44 @@
+import asyncio
+import signal
+import sys
+
+import pytest
+
+import video_processor
+
+
+async def fake_process_video_file(
+    video_data: bytes, filename: str
+) -> tuple[bytes, int, int, float]:
+    return b"processed:" + video_data, 720, 1280, 12.5
+
+
+def test_process_video_file_without_store(monkeypatch):
+    monkeypatch.setattr(video_processor, "get_video_store", lambda: None)
+    monkeypatch.setattr(video_processor, "_process_video_file", fake_process_video_file)
+
+    result = asyncio.run(video_processor.process_video_file(b"source", "video.mp4"))
+
+    assert result == (b"processed:source", 720, 1280)
+
+
+def test_run_ffmpeg_kills_child_on_cancel(monkeypatch):
+    processes = []
+    create_subprocess_exec = asyncio.create_subprocess_exec
+
+    async def spawn(*args, **kwargs):
+        proc = await create_subprocess_exec(*args, **kwargs)
+        processes.append(proc)
+        return proc
+
+    monkeypatch.setattr(video_processor.asyncio, "create_subprocess_exec", spawn)
+
+    async def run() -> None:
+        await asyncio.wait_for(
+            video_processor.run_ffmpeg([sys.executable, "-c", "import time; time.sleep(30)"]),
+            timeout=0.5,
+        )
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(run())
+    assert processes[0].returncode == -signal.SIGKILL
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import time
+
+from video_store import VideoStore
+
+
+def put(store: VideoStore, key: str, data: bytes) -> None:
+    asyncio.run(store.put(key, data, 720, 1280, 1.0))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    store = VideoStore(tmp_path, max_bytes=25)
+    put(store, "a", b"a" * 10)
+    put(store, "b", b"b" * 10)
+    assert asyncio.run(store.get("a")) is not None
+    put(store, "c", b"c" * 10)
+
+    assert asyncio.run(store.get("b")) is None
+    assert not (tmp_path / "b.mp4").exists()
+    assert store.stats()["bytes"] == 20
+
+
+def test_entries_survive_a_restart_in_lru_order(tmp_path):
+    store = VideoStore(tmp_path, max_bytes=100)
+    put(store, "old", b"o" * 10)
+    put(store, "new", b"n" * 10)
+    past = time.time() - 60
+    os.utime(tmp_path / "old.mp4", (past, past))
+
+    restarted = VideoStore(tmp_path, max_bytes=15)
+
+    assert restarted.stats()["entries"] == 1
+    cached = asyncio.run(restarted.get("new"))
+    assert cached is not None
+    data, stored = cached
+    assert data == b"n" * 10
+    assert (stored.width, stored.height, stored.size) == (720, 1280, 10)
+
+
+def test_concurrent_puts_of_one_key_write_once(tmp_path, monkeypatch):
+    store = VideoStore(tmp_path, max_bytes=100)
+    writes: list[str] = []
+    write = store._write
+
+    def counting_write(key, data, stored):
+        writes.append(key)
+        time.sleep(0.05)
+        write(key, data, stored)
+
+    monkeypatch.setattr(store, "_write", counting_write)
+
+    async def run() -> None:
+        await asyncio.gather(*(store.put("k", b"v" * 10, 720, 1280, 1.0) for _ in range(3)))
+
+    asyncio.run(run())
+
+    assert writes == ["k"]
+    assert (tmp_path / "k.mp4").read_bytes() == b"v" * 10
+    assert not list(tmp_path.glob("*.tmp"))
+    assert store.stats()["bytes"] == 10
+
+
+def test_unreadable_entry_evicted_during_read_is_not_subtracted_twice(tmp_path, monkeypatch):
+    store = VideoStore(tmp_path, max_bytes=25)
+    put(store, "a", b"a" * 10)
+    put(store, "b", b"b" * 10)
+
+    def read_while_evicted(key):
+        store.max_bytes = 15
+        store._evict()  # "a" is evicted by another task's put meanwhile
+        raise OSError("gone")
+
+    monkeypatch.setattr(store, "_read", read_while_evicted)
+
+    assert asyncio.run(store.get("a")) is None
+    assert store.stats()["bytes"] == 10